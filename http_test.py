@@ -7,15 +7,29 @@
 """
 
 
+import sys
 import time
 import socket
-import threading
+import asyncio
 import struct
 import argparse
 import logging
+import io
 import json
-from concurrent.futures import ThreadPoolExecutor
-from statistics import mean, median, stdev
+import math
+import re
+import operator
+from array import array
+from itertools import count, compress
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from statistics import median
+
+# 安装了orjson时用它解析服务器返回的JSON，否则使用标准库；两者都可直接解析bytes
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # 配置日志
 logging.basicConfig(
@@ -24,208 +38,544 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 计时使用time.perf_counter_ns()，报告时换算为秒
+NS_PER_SECOND = 1e9
+
+# Ping只是额外的测量，单独使用较短的超时，避免不回应Ping的服务器拖慢整个测试
+# 一旦Ping超时，本次测试的后续连接不再发送Ping
+PING_TIMEOUT = 1
+
+# 测试套接字的发送/接收缓冲区大小
+SOCKET_BUFFER_SIZE = 65536
+
+# 协议中固定不变的部分，直接使用编码后的字节
+# Minecraft协议版本763（相当于1.20.1）的VarInt编码
+PROTOCOL_VERSION_VARINT = b'\xfb\x05'
+# 状态请求包：包长度1，包ID 0x00
+STATUS_REQUEST_PACKET = b'\x01\x00'
+# Ping包头：包长度9（包ID + 8字节载荷），包ID 0x01
+PING_PACKET_HEADER = b'\x09\x01'
+
+# 每次测试只需要在线玩家数，直接在原始JSON字节中查找，不解析整个文档（其中可能包含很大的favicon）
+PLAYERS_ONLINE_PATTERN = re.compile(rb'"online"\s*:\s*(\d+)')
+FAVICON_KEY = b'"favicon"'
+
+# 前n个字节的延续位掩码（VarInt最多5个字节）
+VARINT_CONTINUATION_MASKS = (0, 0x80, 0x8080, 0x808080, 0x80808080, 0x8080808080)
+
+def decode_varint(data, offset, end):
+    # 从data[offset:end]解码VarInt，一次取出最多5个字节整体计算，不逐字节循环
+    # 返回(值, 占用字节数)，数据不完整时字节数为0
+    size = min(end - offset, 5)
+    word = int.from_bytes(data[offset:offset + size], 'little')
+    # 延续位为0的字节即为结尾字节
+    stops = ~word & VARINT_CONTINUATION_MASKS[size]
+    if not stops:
+        if size == 5:
+            raise Exception("VarInt太长")
+        return 0, 0
+    lowest = stops & -stops
+    word &= (lowest << 1) - 1
+    return ((word & 0x7F)
+            | ((word >> 1) & 0x3F80)
+            | ((word >> 2) & 0x1FC000)
+            | ((word >> 3) & 0xFE00000)
+            | ((word >> 4) & 0x7F0000000)), lowest.bit_length() >> 3
+
+class RecvBuffer:
+    # 单个套接字的接收缓冲区，一次recv_into读取多个字节，避免逐字节recv
+    
+    def __init__(self, sock=None, size=512):
+        self.sock = sock
+        self.data = bytearray(size)
+        self.start = 0
+        self.end = 0
+    
+    def _compact(self):
+        # 将未读数据移到缓冲区开头
+        if self.start:
+            remaining = self.end - self.start
+            self.data[:remaining] = self.data[self.start:self.end]
+            self.start = 0
+            self.end = remaining
+    
+    def fill(self):
+        # 从套接字读取一批数据
+        self._compact()
+        if self.end == len(self.data):
+            self.data.extend(bytes(len(self.data)))
+        n = self.sock.recv_into(memoryview(self.data)[self.end:])
+        if not n:
+            raise Exception("连接断开")
+        self.end += n
+    
+    def feed(self, chunk):
+        # 追加由外部（如asyncio的StreamReader）读取到的数据
+        if not chunk:
+            raise Exception("连接断开")
+        self._compact()
+        self.data[self.end:self.end + len(chunk)] = chunk
+        self.end += len(chunk)
+    
+    def read(self, length):
+        # 读取指定长度的数据，先取缓冲区中已有的部分，剩余部分直接读入结果
+        result = bytearray(length)
+        view = memoryview(result)
+        buffered = min(length, self.end - self.start)
+        view[:buffered] = self.data[self.start:self.start + buffered]
+        self.start += buffered
+        received = buffered
+        while received < length:
+            n = self.sock.recv_into(view[received:], length - received)
+            if not n:
+                raise Exception("连接断开")
+            received += n
+        return result
+
+class SummaryStats:
+    # 最小值、最大值、平均值和样本标准差，全部由内置函数在C层面遍历计算
+    # 输入为整数纳秒，求和全程使用整数运算，最后按scale换算单位
+    
+    def __init__(self, values, scale=1.0):
+        values = array('q', values)
+        self.n = len(values)
+        total = sum(values)
+        squares = sum(map(operator.mul, values, values))
+        self.min = min(values) * scale
+        self.max = max(values) * scale
+        self.mean = total / self.n * scale
+        # 离差平方和 = 平方和 - 和的平方 / n，整数运算没有舍入误差
+        self.m2 = (self.n * squares - total * total) / self.n * scale * scale
+    
+    def stdev(self):
+        # 与statistics.stdev一致，使用n-1作为分母
+        return math.sqrt(self.m2 / (self.n - 1))
+
 class MinecraftServerTester:
     
-    def __init__(self, host, port=25565, concurrency=10, connections_per_client=10, timeout=5):
+    def __init__(self, host, port=25565, concurrency=10, connections_per_client=10, timeout=5, use_asyncio=None):
         # 初始化信息
         self.host = host
         self.port = port
         self.concurrency = concurrency
         self.connections_per_client = connections_per_client
         self.timeout = timeout
-        self.results = []
+        # 主机地址在run_test开始时解析一次，避免每次连接都调用getaddrinfo
+        self._sockaddr = None
+        # 默认使用asyncio单线程并发；Windows下的事件循环（Proactor/Selector）在套接字处理上与其他平台存在差异，
+        # 为避免这些边界情况，默认保留多线程方式，可通过use_asyncio显式指定
+        if use_asyncio is None:
+            use_asyncio = sys.platform != 'win32'
+        self.use_asyncio = use_asyncio
         self.success_count = 0
         self.failure_count = 0
         self.total_time = 0
-        self.lock = threading.Lock()
-    
-    def _send_handshake(self, sock):
-        # 发送握手包
-        # Minecraft协议版本（当前763相当于1.20.1）
-        protocol_version = 763
-        host_length = len(self.host)
-        packet = bytearray()
-        packet.extend(self._varint_to_bytes(7 + host_length))
-        packet.extend(self._varint_to_bytes(0x00))
-        packet.extend(self._varint_to_bytes(protocol_version))
-        packet.extend(self._varint_to_bytes(host_length))
-        packet.extend(self.host.encode('utf-8'))
-        packet.extend(struct.pack('>H', self.port))
-        packet.extend(self._varint_to_bytes(1))
-        sock.sendall(packet)
-    
-    def _request_status(self, sock):
-        # 请求服务器状态
-        # 构建状态请求包
-        packet = bytearray()
-        packet.extend(self._varint_to_bytes(1))  # 包长度
-        packet.extend(self._varint_to_bytes(0x00))  # 包ID
-        # 发送状态请求包
-        sock.sendall(packet)
-    
-    def _read_varint(self, sock):
-        data = 0
-        for i in range(5):
-            b = sock.recv(1)
-            if not b:
-                raise Exception("连接断开")
-            byte = b[0]
-            data |= (byte & 0x7F) << (7 * i)
-            if not (byte & 0x80):
-                return data
-        raise Exception("VarInt太长")
-    
-    def _read_response(self, sock):
-        # 读取服务器响应
+        # 按列预分配结果数组，每次连接测试通过计数器领取一个独立的下标，写入时无需加锁
+        # 时间以整数纳秒保存
+        total = concurrency * connections_per_client
+        self.connect_times = array('q', bytes(8 * total))
+        self.response_times = array('q', bytes(8 * total))
+        self.ping_times = array('q', bytes(8 * total))
+        # Ping是额外的测量，失败不影响状态测试是否成功，单独记录
+        self.ping_success = bytearray(total)
+        self._ping_enabled = True
+        self.total_times = array('q', bytes(8 * total))
+        self.players_online = array('q', bytes(8 * total))
+        self.success = bytearray(total)
+        # 服务器信息（最大玩家数、版本、MOTD），取第一个成功的响应
+        self.server_info = None
+        self._slots = count()
+        # VarInt编码用的5字节缓冲区，编码时原地覆盖，不再每次新建bytearray
+        self._scratch = bytearray(5)
+        self._handshake_status = self._build_status_request()
+        # Ping包（包ID 0x01 + 8字节载荷），服务器应原样返回载荷
+        self._ping_payload = struct.pack('>q', int(time.time() * 1000))
+        self._ping_packet = PING_PACKET_HEADER + self._ping_payload
+    
+    def _build_status_request(self):
+        # 构建握手包和状态请求包，主机、端口和协议版本在整个测试中不变，只需构建一次
+        # 只有主机名长度和包长度需要编码，其余部分都是常量
+        scratch = self._scratch
+        host = self.host.encode('utf-8')
+        payload = bytearray(b'\x00')  # 包ID
+        payload += PROTOCOL_VERSION_VARINT
+        payload += scratch[:self._varint_to_bytes(len(host))]
+        payload += host
+        payload += struct.pack('>H', self.port)
+        payload += b'\x01'  # 下一状态：状态查询
+        packet = bytearray(scratch[:self._varint_to_bytes(len(payload))])
+        packet += payload
+        packet += STATUS_REQUEST_PACKET
+        return bytes(packet)
+    
+    def _read_varint(self, buf):
+        # 从接收缓冲区中解码VarInt，缓冲区中数据不完整时才调用recv
+        while True:
+            value, size = decode_varint(buf.data, buf.start, buf.end)
+            if size:
+                buf.start += size
+                return value
+            buf.fill()
+    
+    def _read_response(self, buf):
+        # 读取服务器响应，返回原始JSON字节
         # 读取包长度
-        packet_length = self._read_varint(sock)
+        packet_length = self._read_varint(buf)
         # 读取包ID
-        packet_id = self._read_varint(sock)
+        packet_id = self._read_varint(buf)
         if packet_id != 0:
             raise Exception(f"预期包ID 0，得到 {packet_id}")
-        length = self._read_varint(sock)
-        json_data = b""
-        while len(json_data) < length:
-            chunk = sock.recv(length - len(json_data))
-            if not chunk:
-                raise Exception("连接断开")
-            json_data += chunk
-        return json.loads(json_data.decode('utf-8'))
+        length = self._read_varint(buf)
+        return buf.read(length)
     
-    def _varint_to_bytes(self, value):
-        result = bytearray()
+    def _read_pong(self, buf):
+        # 读取Pong包并校验载荷
+        packet_length = self._read_varint(buf)
+        packet_id = self._read_varint(buf)
+        if packet_id != 1:
+            raise Exception(f"预期包ID 1，得到 {packet_id}")
+        if buf.read(len(self._ping_payload)) != self._ping_payload:
+            raise Exception("Pong载荷不匹配")
+    
+    async def _read_varint_async(self, reader, buf):
+        # 与_read_varint相同，数据不完整时从StreamReader补充
         while True:
-            temp = value & 0x7F
-            value >>= 7
-            if value != 0:
-                temp |= 0x80
-            result.append(temp)
-            if value == 0:
-                break
-        return result
+            value, size = decode_varint(buf.data, buf.start, buf.end)
+            if size:
+                buf.start += size
+                return value
+            buf.feed(await reader.read(512))
+    
+    async def _read_bytes_async(self, reader, buf, length):
+        # 读取指定长度的数据，先取缓冲区中已有的部分，剩余部分从StreamReader读取
+        buffered = min(length, buf.end - buf.start)
+        data = bytes(buf.data[buf.start:buf.start + buffered])
+        buf.start += buffered
+        if buffered < length:
+            data += await reader.readexactly(length - buffered)
+        return data
+    
+    async def _read_response_async(self, reader, buf):
+        # 读取服务器响应，返回原始JSON字节（asyncio版本）
+        packet_length = await self._read_varint_async(reader, buf)
+        packet_id = await self._read_varint_async(reader, buf)
+        if packet_id != 0:
+            raise Exception(f"预期包ID 0，得到 {packet_id}")
+        length = await self._read_varint_async(reader, buf)
+        return await self._read_bytes_async(reader, buf, length)
+    
+    async def _read_pong_async(self, reader, buf):
+        # 读取Pong包并校验载荷（asyncio版本）
+        packet_length = await self._read_varint_async(reader, buf)
+        packet_id = await self._read_varint_async(reader, buf)
+        if packet_id != 1:
+            raise Exception(f"预期包ID 1，得到 {packet_id}")
+        if await self._read_bytes_async(reader, buf, len(self._ping_payload)) != self._ping_payload:
+            raise Exception("Pong载荷不匹配")
+    
+    def _varint_to_bytes(self, value, out=None):
+        # 将VarInt写入out（默认为实例的5字节缓冲区），返回写入的字节数
+        if out is None:
+            out = self._scratch
+        # 负数按32位补码编码
+        value &= 0xFFFFFFFF
+        if value < 0x80:
+            out[0] = value
+            return 1
+        out[0] = (value & 0x7F) | 0x80
+        if value < 0x4000:
+            out[1] = value >> 7
+            return 2
+        out[1] = ((value >> 7) & 0x7F) | 0x80
+        if value < 0x200000:
+            out[2] = value >> 14
+            return 3
+        out[2] = ((value >> 14) & 0x7F) | 0x80
+        if value < 0x10000000:
+            out[3] = value >> 21
+            return 4
+        out[3] = ((value >> 21) & 0x7F) | 0x80
+        out[4] = value >> 28
+        return 5
+    
+    def _record_success(self, slot, connect_time, elapsed, response):
+        # 将一次成功的测试结果写入对应下标
+        self.connect_times[slot] = connect_time
+        self.response_times[slot] = elapsed - connect_time
+        self.total_times[slot] = elapsed
+        # 不完整解析每个响应，但至少要求是一个JSON对象
+        stripped = response.strip()
+        if not (stripped.startswith(b'{') and stripped.endswith(b'}')):
+            raise Exception("状态响应不是JSON对象")
+        self.players_online[slot] = self._find_players_online(response)
+        # 服务器信息只在报告中显示一次，只需完整解析第一个成功的响应
+        # 解析失败时抛出异常，该次测试算作失败
+        if self.server_info is None:
+            self.server_info = self._parse_server_info(response)
+        # 所有检查通过后才标记为成功
+        self.success[slot] = 1
+    
+    def _find_players_online(self, response):
+        # 跳过favicon的base64数据，只在它前后两段中查找在线玩家数
+        favicon = response.find(FAVICON_KEY)
+        if favicon < 0:
+            match = PLAYERS_ONLINE_PATTERN.search(response)
+        else:
+            # base64数据中不含引号，值的结束位置是键后的第二个引号
+            value_start = response.find(b'"', favicon + len(FAVICON_KEY))
+            value_end = response.find(b'"', value_start + 1) if value_start >= 0 else -1
+            match = PLAYERS_ONLINE_PATTERN.search(response, 0, favicon)
+            if match is None and value_end >= 0:
+                match = PLAYERS_ONLINE_PATTERN.search(response, value_end + 1)
+        return int(match.group(1)) if match else 0
+    
+    def _parse_server_info(self, response):
+        # 解析服务器信息（最大玩家数、版本、MOTD）
+        status = json_loads(response)
+        if not isinstance(status, dict):
+            raise Exception("状态响应不是JSON对象")
+        players = status.get('players', {})
+        version = status.get('version', {})
+        if not isinstance(players, dict) or not isinstance(version, dict):
+            raise Exception("状态响应格式错误")
+        return (
+            players.get('max', 0),
+            version.get('name', 'Unknown'),
+            status.get('description', 'Unknown')
+        )
+    
+    def _disable_ping(self):
+        # 服务器没有在限定时间内回应Ping，停止后续连接的Ping测量
+        if self._ping_enabled:
+            self._ping_enabled = False
+            logger.debug("Ping timed out, skipping ping for remaining connections")
+    
+    def _create_socket(self):
+        # 创建测试用套接字并在连接前设置选项
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # 禁用Nagle算法，握手包等小包立即发出，避免最多40ms的额外延迟影响测量结果
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        # 仅Linux支持：立即回复ACK，不使用延迟确认
+        if hasattr(socket, 'TCP_QUICKACK'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        # 大量短连接会让本地端口停留在TIME_WAIT状态直至耗尽，导致虚假的连接失败；
+        # linger=0使关闭时直接发送RST，跳过TIME_WAIT
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        return sock
     
     def _test_connection(self):
         # 测试与服务器的连接并获取状态
-        start_time = time.time()
+        slot = next(self._slots)
+        start_time = time.perf_counter_ns()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            with self._create_socket() as sock:
                 sock.settimeout(self.timeout)
                 # 连接服务器
-                connect_start = time.time()
-                sock.connect((self.host, self.port))
-                connect_time = time.time() - connect_start
+                connect_start = time.perf_counter_ns()
+                sock.connect(self._sockaddr)
+                connect_time = time.perf_counter_ns() - connect_start
                 
-                # 发送握手包
-                self._send_handshake(sock)
-                # 请求状态
-                self._request_status(sock)
+                # 发送握手包和状态请求
+                sock.sendall(self._handshake_status)
                 # 读取响应
-                response = self._read_response(sock)
+                buf = RecvBuffer(sock)
+                response = self._read_response(buf)
+                
+                elapsed = time.perf_counter_ns() - start_time
                 
-                elapsed = time.time() - start_time
+                self._record_success(slot, connect_time, elapsed, response)
                 
-                with self.lock:
-                    self.success_count += 1
-                    self.results.append({
-                        'success': True,
-                        'connect_time': connect_time,
-                        'response_time': elapsed - connect_time,
-                        'total_time': elapsed,
-                        'players_online': response.get('players', {}).get('online', 0),
-                        'players_max': response.get('players', {}).get('max', 0),
-                        'version': response.get('version', {}).get('name', 'Unknown'),
-                        'motd': response.get('description', 'Unknown')
-                    })
-                    self.total_time += elapsed
+                # 在同一连接上发送Ping包，测量不含建立连接开销的往返时间
+                # （原版服务器在Pong之后会关闭连接，因此每个连接只能Ping一次）
+                # 部分服务器或代理返回状态后直接关闭连接，Ping失败时状态测试仍算成功
+                if self._ping_enabled:
+                    try:
+                        sock.settimeout(min(self.timeout, PING_TIMEOUT))
+                        ping_start = time.perf_counter_ns()
+                        sock.sendall(self._ping_packet)
+                        self._read_pong(buf)
+                        self.ping_times[slot] = time.perf_counter_ns() - ping_start
+                        self.ping_success[slot] = 1
+                    except socket.timeout:
+                        self._disable_ping()
+                    except Exception as e:
+                        logger.debug("Ping failed: %s", e)
                 
-                return {
-                    'success': True,
-                    'connect_time': connect_time,
-                    'response_time': elapsed - connect_time,
-                    'total_time': elapsed,
-                    'players_online': response.get('players', {}).get('online', 0),
-                    'players_max': response.get('players', {}).get('max', 0),
-                    'version': response.get('version', {}).get('name', 'Unknown'),
-                    'motd': response.get('description', 'Unknown')
-                }
+                # 结果已写入数组，调用方只需要知道是否出错
+                return None
         except Exception as e:
-            elapsed = time.time() - start_time
-            with self.lock:
-                self.failure_count += 1
-                self.results.append({
-                    'success': False,
-                    'error': str(e),
-                    'total_time': elapsed
-                })
-            return {
-                'success': False,
-                'error': str(e),
-                'total_time': elapsed
-            }
-    
-    def _client_worker(self):
-        for _ in range(self.connections_per_client):
-            result = self._test_connection()
-            if not result['success']:
-                logger.warning(f"Connection failed: {result.get('error', 'Unknown error')}")
+            self.total_times[slot] = time.perf_counter_ns() - start_time
+            return str(e)
+    
+    async def _test_connection_async(self, semaphore):
+        # 测试与服务器的连接并获取状态（asyncio版本），信号量限制同时进行的连接数
+        async with semaphore:
+            slot = next(self._slots)
+            start_time = time.perf_counter_ns()
+            sock = None
+            writer = None
+            try:
+                # 连接服务器，使用与多线程方式相同的套接字选项
+                sock = self._create_socket()
+                sock.setblocking(False)
+                connect_start = time.perf_counter_ns()
+                await asyncio.wait_for(
+                    asyncio.get_running_loop().sock_connect(sock, self._sockaddr), self.timeout)
+                connect_time = time.perf_counter_ns() - connect_start
+                reader, writer = await asyncio.open_connection(sock=sock)
+                
+                # 发送握手包和状态请求
+                writer.write(self._handshake_status)
+                await writer.drain()
+                # 读取响应
+                buf = RecvBuffer()
+                response = await asyncio.wait_for(self._read_response_async(reader, buf), self.timeout)
+                
+                elapsed = time.perf_counter_ns() - start_time
+                
+                self._record_success(slot, connect_time, elapsed, response)
+                
+                # 在同一连接上发送Ping包，测量不含建立连接开销的往返时间，Ping失败时状态测试仍算成功
+                if self._ping_enabled:
+                    try:
+                        ping_start = time.perf_counter_ns()
+                        await asyncio.wait_for(self._ping_async(reader, writer, buf), min(self.timeout, PING_TIMEOUT))
+                        self.ping_times[slot] = time.perf_counter_ns() - ping_start
+                        self.ping_success[slot] = 1
+                    except asyncio.TimeoutError:
+                        self._disable_ping()
+                    except Exception as e:
+                        logger.debug("Ping failed: %s", e)
+                return None
+            except Exception as e:
+                self.total_times[slot] = time.perf_counter_ns() - start_time
+                # asyncio.TimeoutError的str()为空字符串
+                return str(e) or type(e).__name__
+            finally:
+                if writer is not None:
+                    writer.close()
+                elif sock is not None:
+                    sock.close()
+    
+    async def _ping_async(self, reader, writer, buf):
+        # 发送Ping包并等待Pong（asyncio版本）
+        writer.write(self._ping_packet)
+        await writer.drain()
+        await self._read_pong_async(reader, buf)
+    
+    async def _run_async(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        total = self.concurrency * self.connections_per_client
+        errors = await asyncio.gather(*[self._test_connection_async(semaphore) for _ in range(total)])
+        for error in errors:
+            if error is not None:
+                logger.warning("Connection failed: %s", error)
+    
+    def _run_threaded(self):
+        # 每次连接测试作为独立任务提交，空闲线程立即领取下一个任务，
+        # 不会因某个客户端的慢响应而阻塞它后续的测试
+        # 同时最多保留concurrency*4个待完成的任务，避免一次性创建全部Future
+        total = self.concurrency * self.connections_per_client
+        max_pending = self.concurrency * 4
+        submitted = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while submitted < total or pending:
+                while submitted < total and len(pending) < max_pending:
+                    pending.add(executor.submit(self._test_connection))
+                    submitted += 1
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    error = future.result()
+                    if error is not None:
+                        logger.warning("Connection failed: %s", error)
+    
+    def _write_time_stats(self, report, name, stats, values, mask):
+        # 写入一组时间指标的统计数据，mask标记参与统计的下标
+        report.write("Min %s time: %.4fs\n" % (name, stats.min))
+        report.write("Max %s time: %.4fs\n" % (name, stats.max))
+        report.write("Average %s time: %.4fs\n" % (name, stats.mean))
+        report.write("Median %s time: %.4fs\n" % (name, median(compress(values, mask)) / NS_PER_SECOND))
+        if stats.n > 1:
+            report.write("Standard deviation: %.4fs\n" % stats.stdev())
+        else:
+            report.write("Standard deviation: N/A\n")
     
     def run_test(self):
-        logger.info(f"Starting Minecraft server test on {self.host}:{self.port}")
-        logger.info(f"Concurrency: {self.concurrency}, Connections per client: {self.connections_per_client}")
+        logger.info("Starting Minecraft server test on %s:%d", self.host, self.port)
+        logger.info("Concurrency: %d, Connections per client: %d", self.concurrency, self.connections_per_client)
         
-        start_time = time.time()
+        try:
+            self._sockaddr = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+        except socket.gaierror as e:
+            logger.error("Could not resolve server address %s: %s", self.host, e)
+            return
         
-        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
-            for _ in range(self.concurrency):
-                executor.submit(self._client_worker)
+        start_time = time.perf_counter_ns()
         
-        total_time = time.time() - start_time
+        if self.use_asyncio:
+            asyncio.run(self._run_async())
+        else:
+            self._run_threaded()
+        
+        total_time = (time.perf_counter_ns() - start_time) / NS_PER_SECOND
         
         # 计算统计数据
-        success_results = [r for r in self.results if r['success']]
+        self.success_count = sum(self.success)
+        self.failure_count = len(self.success) - self.success_count
         
-        if success_results:
-            connect_times = [r['connect_time'] for r in success_results]
-            response_times = [r['response_time'] for r in success_results]
-            total_times = [r['total_time'] for r in success_results]
+        if self.success_count:
+            connect_stats = SummaryStats(compress(self.connect_times, self.success), 1 / NS_PER_SECOND)
+            response_stats = SummaryStats(compress(self.response_times, self.success), 1 / NS_PER_SECOND)
+            ping_count = sum(self.ping_success)
+            self.total_time = sum(compress(self.total_times, self.success)) / NS_PER_SECOND
+            players_max, version, motd = self.server_info or (0, 'Unknown', 'Unknown')
             
             # 计算平均在线玩家数
-            avg_players = mean(r['players_online'] for r in success_results)
+            avg_players = sum(compress(self.players_online, self.success)) / self.success_count
+            
+            success_rate = self.success_count / (self.success_count + self.failure_count) * 100
             
-            logger.info("\n===== Test Results =====")
-            logger.info(f"Total connections: {self.success_count + self.failure_count}")
-            logger.info(f"Successful connections: {self.success_count}")
-            logger.info(f"Failed connections: {self.failure_count}")
-            logger.info(f"Success rate: {self.success_count / (self.success_count + self.failure_count) * 100:.2f}%")
-            logger.info(f"Total test time: {total_time:.2f} seconds")
-            logger.info("\n=== Connection Statistics ===")
-            logger.info(f"Min connect time: {min(connect_times):.4f}s")
-            logger.info(f"Max connect time: {max(connect_times):.4f}s")
-            logger.info(f"Average connect time: {mean(connect_times):.4f}s")
-            logger.info(f"Median connect time: {median(connect_times):.4f}s")
-            logger.info(f"Standard deviation: {stdev(connect_times):.4f}s" if len(connect_times) > 1 else "Standard deviation: N/A")
-            logger.info("\n=== Response Statistics ===")
-            logger.info(f"Min response time: {min(response_times):.4f}s")
-            logger.info(f"Max response time: {max(response_times):.4f}s")
-            logger.info(f"Average response time: {mean(response_times):.4f}s")
-            logger.info(f"Median response time: {median(response_times):.4f}s")
-            logger.info(f"Standard deviation: {stdev(response_times):.4f}s" if len(response_times) > 1 else "Standard deviation: N/A")
-            logger.info("\n=== Server Information ===")
-            logger.info(f"Average players online: {avg_players:.1f}")
-            logger.info(f"Server version: {success_results[0]['version']}")
-            logger.info(f"MOTD: {success_results[0]['motd']}")
+            # 整个报告先写入缓冲区，最后一次性输出
+            report = io.StringIO()
+            report.write("\n===== Test Results =====\n")
+            report.write("Total connections: %d\n" % (self.success_count + self.failure_count))
+            report.write("Successful connections: %d\n" % self.success_count)
+            report.write("Failed connections: %d\n" % self.failure_count)
+            report.write("Success rate: %.2f%%\n" % success_rate)
+            report.write("Total test time: %.2f seconds\n" % total_time)
+            report.write("\n=== Connection Statistics ===\n")
+            self._write_time_stats(report, "connect", connect_stats, self.connect_times, self.success)
+            report.write("\n=== Response Statistics ===\n")
+            self._write_time_stats(report, "response", response_stats, self.response_times, self.success)
+            # Ping只统计成功收到Pong的连接
+            report.write("\n=== Ping Statistics ===\n")
+            report.write("Successful pings: %d/%d\n" % (ping_count, self.success_count))
+            if not self._ping_enabled:
+                report.write("Ping timed out, later connections skipped the ping\n")
+            if ping_count:
+                ping_stats = SummaryStats(compress(self.ping_times, self.ping_success), 1 / NS_PER_SECOND)
+                self._write_time_stats(report, "ping", ping_stats, self.ping_times, self.ping_success)
+            report.write("\n=== Server Information ===\n")
+            report.write("Average players online: %.1f\n" % avg_players)
+            report.write("Server version: %s\n" % (version,))
+            report.write("MOTD: %s\n" % (motd,))
             
-            if self.failure_count == 0 and mean(response_times) < 0.2:
-                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下表现优异，成功率100%，平均响应时间{mean(response_times):.2f}秒，展现出出色的稳定性和处理能力。"
-            elif self.failure_count < 0.05 * (self.success_count + self.failure_count) and mean(response_times) < 0.5:
-                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下表现良好，成功率{(self.success_count / (self.success_count + self.failure_count) * 100):.2f}%，平均响应时间{mean(response_times):.2f}秒，可稳定应对当前负载。"
-            elif mean(response_times) >= 1 or self.failure_count > 0.1 * (self.success_count + self.failure_count):
-                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下出现明显压力，成功率{(self.success_count / (self.success_count + self.failure_count) * 100):.2f}%，平均响应时间{mean(response_times):.2f}秒，建议优化服务器配置或增加硬件资源。"
+            if self.failure_count == 0 and response_stats.mean < 0.2:
+                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下表现优异，成功率100%，平均响应时间{response_stats.mean:.2f}秒，展现出出色的稳定性和处理能力。"
+            elif self.failure_count < 0.05 * (self.success_count + self.failure_count) and response_stats.mean < 0.5:
+                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下表现良好，成功率{success_rate:.2f}%，平均响应时间{response_stats.mean:.2f}秒，可稳定应对当前负载。"
+            elif response_stats.mean >= 1 or self.failure_count > 0.1 * (self.success_count + self.failure_count):
+                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下出现明显压力，成功率{success_rate:.2f}%，平均响应时间{response_stats.mean:.2f}秒，建议优化服务器配置或增加硬件资源。"
             else:
-                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下表现一般，成功率{(self.success_count / (self.success_count + self.failure_count) * 100):.2f}%，平均响应时间{mean(response_times):.2f}秒，存在一定优化空间。"
+                summary = f"压力测试显示，服务器在{self.concurrency}并发连接下表现一般，成功率{success_rate:.2f}%，平均响应时间{response_stats.mean:.2f}秒，存在一定优化空间。"
             
-            logger.info(f"\n=== 测试总结 ===")
-            logger.info(summary)
+            report.write("\n=== 测试总结 ===\n")
+            report.write(summary)
+            logger.info("%s", report.getvalue())
         else:
             logger.error("No successful connections were made. The server might be offline or unreachable.")
 